@@ -1,12 +1,80 @@
+import contextlib
+import hashlib
+import os
+import threading
+import uuid
+
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import pandas as pd
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
+from flask_caching import Cache
+import plotly.graph_objects as go
+import plotly.io as pio
 import numpy as np
 
+try:
+    import fcntl  # File locks shared by every gunicorn worker (not available on Windows)
+except ImportError:
+    fcntl = None
+
+# Encode figures (and every Dash callback response, which goes through plotly's encoder) with orjson
+# Set explicitly rather than left on 'auto', so a missing orjson fails at startup instead of silently
+# falling back to the slower stdlib json
+pio.json.config.default_engine = 'orjson'
+
 # Initialize the Dash app
 app = dash.Dash(__name__)
 
+# Directory for the app's cache files (sessions, figures and the session lock), set with CBC_DATA_DIR
+# Cache files are unpickled, so they live in a directory only this user can access rather than a shared temp path
+data_dir = os.getenv('CBC_DATA_DIR', os.path.join(os.path.expanduser('~'), '.cbc-cache'))
+os.makedirs(data_dir, mode=0o700, exist_ok=True)
+
+# Server-side cache holding each session's data (no JSON round trip per callback)
+# Kept on disk so every gunicorn worker process sees the same sessions
+cache = Cache(app.server, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.path.join(data_dir, 'sessions'),
+    'CACHE_DEFAULT_TIMEOUT': 7 * 24 * 60 * 60,  # A session expires a week after its last change (each save resets it)
+    'CACHE_THRESHOLD': 10000  # Past this many sessions, the ones saved least recently are removed first
+})
+
+# Lock around loading, changing and saving a session, so concurrent callbacks on the same session
+# (threads of a worker, or workers sharing the cache directory) can't overwrite each other's changes
+# Sessions are spread over a fixed set of lock files by a hash of their id, so callbacks on different
+# sessions almost never wait on each other and lock files don't pile up as sessions come and go
+session_lock_count = 1024
+session_lock_dir = os.path.join(data_dir, 'locks')
+os.makedirs(session_lock_dir, exist_ok=True)
+# Without fcntl (Windows) there is one thread lock per lock file instead, which covers a single process
+session_thread_locks = [threading.Lock() for _ in range(session_lock_count)] if fcntl is None else None
+
+
+@contextlib.contextmanager
+def session_lock(session_id):
+    slot = int(hashlib.md5(session_id.encode()).hexdigest(), 16) % session_lock_count
+    if fcntl is None:
+        with session_thread_locks[slot]:
+            yield
+        return
+    with open(os.path.join(session_lock_dir, f'{slot}.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+        yield
+
+
+# Separate cache for memoized figures, so cached figures never push session data out of the cache above
+# Also on disk, so a figure built by one gunicorn worker is reused by the others
+figure_cache = Cache(app.server, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.path.join(data_dir, 'figures'),
+    'CACHE_DEFAULT_TIMEOUT': 600
+})
+
+# Fingerprint of this script, added to build_figure's memoize key so figures cached by a previous
+# version of the code are never reused (they simply expire)
+with open(__file__, 'rb') as source_file:
+    code_version = hashlib.md5(source_file.read()).hexdigest()
+
 # Define the pitch types in the specified order
 pitch_types = [
     "Fastball", "Changeup", "Curveball", "Slider", "Sinker", 
@@ -30,280 +98,613 @@ pitch_colors = {
     "Knuckleball": "gray"
 }
 
+# Integer code of each pitch type (its index in pitch_types), stored per data point instead of the name
+pitch_codes = {pitch: code for code, pitch in enumerate(pitch_types)}
+
+# (pitch, color) pairs in pitch_types order, and each pitch code's color, so the figure code
+# indexes colors by code instead of looking each pitch name up in pitch_colors
+pitch_color_pairs = tuple((pitch, pitch_colors[pitch]) for pitch in pitch_types)
+code_colors = tuple(color for pitch, color in pitch_color_pairs)
+
+# Dropdown options, built once at import rather than on every layout render
+pitch_options = tuple({"label": pitch, "value": pitch} for pitch in pitch_types)
+draw_color_options = tuple({"label": pitch, "value": color} for pitch, color in pitch_color_pairs)
+
+# Static figure layout, built once at import instead of on every callback
+# Written out as nested dicts: underscore shorthands like xaxis_title are applied after the nested
+# dicts at construction and would replace them (dropping the title fonts)
+figure_layout = dict(
+    legend=dict(title=dict(text="Pitch")),
+    font=dict(family="Roboto"),
+    title=dict(font=dict(size=24, color="darkblue")),  # Title text is added per figure
+    xaxis=dict(
+        title=dict(text="Horizontal (IN)", font=dict(size=18, family="Roboto")),
+        range=[-20, 20],  # Fixed x-axis range
+        scaleanchor="y",  # Ensure x and y axes are scaled equally
+        scaleratio=1,  # Maintain a 1:1 aspect ratio
+        showgrid=True,
+        gridcolor="lightgray",  # Light gray gridlines
+        gridwidth=1,  # Thin gridlines
+        zeroline=True,  # Show the x=0 line
+        zerolinewidth=2,  # Bold x=0 line
+        zerolinecolor='black'  # Color of the x=0 line
+    ),
+    yaxis=dict(
+        title=dict(text="Vertical (IN)", font=dict(size=18, family="Roboto")),
+        range=[-20, 20],  # Fixed y-axis range
+        showgrid=True,
+        gridcolor="lightgray",  # Light gray gridlines
+        gridwidth=1,  # Thin gridlines
+        zeroline=True,  # Show the y=0 line
+        zerolinewidth=2,  # Bold y=0 line
+        zerolinecolor='black'  # Color of the y=0 line
+    ),
+    plot_bgcolor='white',  # Set background color to white
+    uirevision='cbc',  # Keep the user's zoom, pan and legend state when a new figure is returned
+    width=800,  # Set a fixed width for the graph
+    height=800  # Set a fixed height for the graph (to make it square)
+)
+
 # Layout of the app
-# Layout of the app
-app.layout = html.Div([
-    # Logo
-    html.Img(src=app.get_asset_url('CBClogo.png'), style={'height': '100px', 'margin': '10px'}),
-    
-    # Title
-    html.H1("Chapman Baseball Compound", style={'fontFamily': 'Roboto', 'color': 'darkblue'}),
-    
-    # Athlete Name Input
-    html.Div([
-        html.Label("Athlete Name", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="athlete-name", type="text", value="", placeholder="Enter Athlete Name"),
-    ], style={'marginBottom': '10px'}),
-    
-    # Input fields with Pitch at the top
-    html.Div([
-        html.Label("Pitch", style={'fontFamily': 'Roboto'}),
+# Layout is served by a function so every page load gets its own session id
+def serve_layout():
+    session_id = str(uuid.uuid4())
+    session = new_session()  # Nothing is saved for a new session id, so skip the cache
+    return html.Div([
+        # Session id used as the key for this session's data in the server-side cache
+        dcc.Store(id='session-id', data=session_id),
+
+        # Revision of the session's data points that the figure on the page shows
+        dcc.Store(id='data-revision', data=session['revision']),
+
+        # Logo
+        html.Img(src=app.get_asset_url('CBClogo.png'), style={'height': '100px', 'margin': '10px'}),
+        
+        # Title
+        html.H1("Chapman Baseball Compound", style={'fontFamily': 'Roboto', 'color': 'darkblue'}),
+        
+        # Athlete Name Input
+        html.Div([
+            html.Label("Athlete Name", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="athlete-name", type="text", value="", placeholder="Enter Athlete Name"),
+        ], style={'marginBottom': '10px'}),
+        
+        # Input fields with Pitch at the top
+        html.Div([
+            html.Label("Pitch", style={'fontFamily': 'Roboto'}),
+            dcc.Dropdown(
+                id="pitch-type",
+                options=pitch_options,
+                value="Fastball",  # Default value
+                clearable=False  # Prevent users from clearing the selection
+            ),
+            
+            # Swapped order of vertical and horizontal input boxes
+            html.Label("Vertical (IN)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="vertical-movement", type="number", value=0),
+            
+            html.Label("Horizontal (IN)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="horizontal-movement", type="number", value=0),
+            
+            html.Label("Velo (MPH)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="pitch-speed", type="number", value=0),  # Fixed type="number"
+            
+            html.Button('Add Data Point', id='add-point', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
+            html.Button('Delete Most Recent Point', id='delete-recent', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
+            html.Button('Delete All Data', id='delete-all', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
+            html.Button('Reset Axes', id='reset-axes', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
+
+            # Message shown when the session's data points are no longer on the server
+            html.Div(id='session-status', style={'fontFamily': 'Roboto', 'color': 'red'})
+        ]),
+        
+        # Drawing tool
+        html.Label("Select Draw Color (Pitch Type)", style={'fontFamily': 'Roboto'}),
         dcc.Dropdown(
-            id="pitch-type",
-            options=[{"label": pitch, "value": pitch} for pitch in pitch_types],
-            value="Fastball",  # Default value
-            clearable=False  # Prevent users from clearing the selection
+            id="draw-color",
+            options=draw_color_options,
+            value="red",  # Default color
+            clearable=False
         ),
         
-        # Swapped order of vertical and horizontal input boxes
-        html.Label("Vertical (IN)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="vertical-movement", type="number", value=0),
+        # Delete Last Drawing Button
+        html.Button('Delete Last Drawing', id='delete-last-drawing', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
         
-        html.Label("Horizontal (IN)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="horizontal-movement", type="number", value=0),
+        # Add Shaded Circle Section
+        html.Div([
+            html.Label("Add Shaded Circle", style={'fontFamily': 'Roboto'}),
+            html.Label("Center X (IN)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="circle-x", type="number", value=0),
+            html.Label("Center Y (IN)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="circle-y", type="number", value=0),
+            html.Label("Radius (IN)", style={'fontFamily': 'Roboto'}),
+            dcc.Input(id="circle-radius", type="number", value=0),
+            html.Button('Add Shaded Circle', id='add-shaded-circle', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'})
+        ], style={'marginBottom': '10px'}),
         
-        html.Label("Velo (MPH)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="pitch-speed", type="number", value=0),  # Fixed type="number"
+        # Delete Most Recent Shaded Circle Button
+        html.Button('Delete Most Recent Shaded Circle', id='delete-most-recent-shaded-circle', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
         
-        html.Button('Add Data Point', id='add-point', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
-        html.Button('Delete Most Recent Point', id='delete-recent', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
-        html.Button('Delete All Data', id='delete-all', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
-        html.Button('Reset Axes', id='reset-axes', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'})
-    ]),
-    
-    # Drawing tool
-    html.Label("Select Draw Color (Pitch Type)", style={'fontFamily': 'Roboto'}),
-    dcc.Dropdown(
-        id="draw-color",
-        options=[{"label": pitch, "value": pitch_colors[pitch]} for pitch in pitch_types],
-        value="red",  # Default color
-        clearable=False
-    ),
-    
-    # Delete Last Drawing Button
-    html.Button('Delete Last Drawing', id='delete-last-drawing', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
-    
-    # Add Shaded Circle Section
-    html.Div([
-        html.Label("Add Shaded Circle", style={'fontFamily': 'Roboto'}),
-        html.Label("Center X (IN)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="circle-x", type="number", value=0),
-        html.Label("Center Y (IN)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="circle-y", type="number", value=0),
-        html.Label("Radius (IN)", style={'fontFamily': 'Roboto'}),
-        dcc.Input(id="circle-radius", type="number", value=0),
-        html.Button('Add Shaded Circle', id='add-shaded-circle', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'})
-    ], style={'marginBottom': '10px'}),
+        # Graph
+        dcc.Graph(
+            id='movement-graph',
+            figure=build_figure(session_key(session), session, [], [], '', 0),  # Empty figure, so no callback runs on page load
+            config={
+                'modeBarButtonsToAdd': ['drawopenpath'],  # Enable freehand drawing
+                'modeBarButtonsToRemove': [
+                    'zoom2d', 'pan2d', 'select2d', 'lasso2d', 'zoomIn2d', 'zoomOut2d', 'autoScale2d', 'resetScale2d',
+                    'hoverClosestCartesian', 'hoverCompareCartesian', 'toggleSpikelines'
+                ],  # Remove all other tools
+                'toImageButtonOptions': {
+                    'format': 'png',  # Ensure the download button saves as PNG
+                    'filename': 'pitch_movement_visualization',  # Default filename
+                },
+                'scrollZoom': False  # Disable zooming
+            }
+        ),
+        
+        # Hidden div to store the drawing shapes
+        dcc.Store(id='drawing-store', data=[]),
+        
+        # Hidden div to store the shaded circles
+        dcc.Store(id='shaded-circles-store', data=[])
+    ])
+
+
+# Columns of a session's data points and their dtypes; each column is kept in its own
+# NumPy buffer, allocated with its dtype so values are never re-inferred
+# float32 is plenty for inch and MPH values and halves the memory of float64
+data_columns = {
+    'pitch_code': np.int8,
+    'horizontal': np.float32,
+    'vertical': np.float32,
+    'velo': np.float32,
+    'pitch_number': np.int64
+}
+
+
+# A session's state: the number of data points, the Pitch# to give the next point (which keeps
+# counting up across deletes), the revision (counting every change to the data points), and a
+# buffer per column; a new session has no data points
+def new_session():
+    session = {'n_rows': 0, 'next_id': 0, 'revision': 0}
+    for column, dtype in data_columns.items():
+        session[column] = np.zeros(0, dtype=dtype)
+    return session
+
+
+# Load a session's state from the server-side cache, or a new session when none is saved
+# Saved sessions hold only their data points, so a loaded buffer is exactly n_rows long
+def load_session(session_id):
+    session = cache.get(session_id)
+    if session is None:
+        session = new_session()
+    return session
+
+
+# Save a session to the server-side cache with only the first n_rows entries of each column,
+# so each save writes the data points rather than the whole buffers
+def save_session(session_id, session):
+    n = session['n_rows']
+    cache.set(session_id, dict(session, **{column: session[column][:n] for column in data_columns}))
+
+
+# Fingerprint of a session's data points, used as the memoize key for build_figure
+def session_key(session):
+    n = session['n_rows']
+    digest = hashlib.md5()
+    for column in data_columns:
+        digest.update(session[column][:n].tobytes())
+    return digest.hexdigest()
+
+
+# Store a value at index n of a column buffer, growing the buffer (same dtype) by one slot when it is full
+# A callback adds at most one point to a freshly loaded (full) buffer, so one slot is all it needs
+def buffer_append(buffer, n, value):
+    if n == len(buffer):
+        buffer = np.concatenate([buffer, np.zeros(1, dtype=buffer.dtype)])
+    buffer[n] = np.nan if value is None else value  # Blank inputs are stored as NaN
+    return buffer
+
+
+# Movement stats of every pitch type in one vectorized pass, using np.bincount over the pitch codes
+# Returns one row per pitch code: horizontal mean, horizontal std, vertical mean, vertical std
+# The mean is NaN for a pitch type with no values, and the sample standard deviation until it has two
+def pitch_stats(session):
+    n = session['n_rows']
+    codes = session['pitch_code'][:n]
+    stats = []
+    for column in ('horizontal', 'vertical'):
+        values = session[column][:n].astype(np.float64)  # Accumulate in float64
+        valid = ~np.isnan(values)  # Skip blank inputs
+        counts = np.bincount(codes[valid], minlength=len(pitch_types))
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=len(pitch_types))
+        squares = np.bincount(codes[valid], weights=values[valid] ** 2, minlength=len(pitch_types))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+            # Clamped at zero, since rounding can leave identical values slightly negative
+            var = np.where(counts > 1, np.maximum(squares - sums * mean, 0) / (counts - 1), np.nan)
+        stats.extend([mean, np.sqrt(var)])  # One sqrt over every pitch type's variance
+    return np.column_stack(stats)
+
+
+# Number of data points of each pitch type, indexed by pitch code
+def pitch_counts(session):
+    return np.bincount(session['pitch_code'][:session['n_rows']], minlength=len(pitch_types))
+
+
+# Index of a pitch code's trace: one trace per plotted pitch type, in code order,
+# so it is the number of plotted pitch types with a lower code
+def trace_index(counts, code):
+    return int(np.count_nonzero(counts[:code]))
+
+
+# Dotted circles spanning one standard deviation around each pitch type's mean movement
+# codes are the pitch codes, and stats has one row per code, as returned by pitch_stats:
+# horizontal mean, horizontal std, vertical mean, vertical std
+def variance_shapes(codes, stats):
+    stats = np.asarray(stats, dtype=float).reshape(-1, 4)
+    means = stats[:, [0, 2]]
+    stds = stats[:, [1, 3]]
+    valid = ~np.isnan(stds).any(axis=1)  # The std is undefined until a pitch type has two points
+    # Circle bounds for every pitch type at once: (x0, y0) and (x1, y1)
+    lows = (means - stds).tolist()
+    highs = (means + stds).tolist()
+    return [
+        dict(
+            type="circle",
+            x0=low[0],
+            x1=high[0],
+            y0=low[1],
+            y1=high[1],
+            line=dict(color=color, width=2, dash='dot'),  # Dotted line for variance
+            layer="below"
+        ) if is_valid else
+        # Hidden placeholder so each pitch's variance circle has the same index as its trace
+        dict(type="circle", visible=False, x0=0, x1=0, y0=0, y1=0)
+        for color, low, high, is_valid in zip((code_colors[code] for code in codes), lows, highs, valid)
+    ]
+
+
+# Each plotted pitch code's movement and hover data (Velo, Pitch#), gathered in one pass:
+# a stable sort by pitch code puts each pitch type's points together, still in entry order,
+# and the sorted columns are split at the pitch counts (instead of one mask per pitch type)
+def pitch_groups(session):
+    n = session['n_rows']
+    order = np.argsort(session['pitch_code'][:n], kind='stable')
+    counts = pitch_counts(session)
+    splits = np.cumsum(counts)[:-1]
+    columns = [np.split(session[column][:n][order], splits) for column in ('horizontal', 'vertical', 'velo', 'pitch_number')]
+    return [
+        (code, horizontal, vertical, np.column_stack([velo, pitch_number]))
+        for code, (count, horizontal, vertical, velo, pitch_number) in enumerate(zip(counts, *columns))
+        if count
+    ]
+
+
+# Patch a single pitch type's trace and variance circle instead of rebuilding the whole figure
+# Appends the data point at index row to the trace, or removes the trace's last point when row is None,
+# so each add or delete sends one point rather than the whole trace
+# These deltas build on whatever the page shows, so only use this when the page's data-revision
+# matches the session (see update_points); otherwise one missed response would skew every later patch
+def patch_pitch(session, code, trace_idx, row=None):
+    patched_fig = Patch()
+    trace = patched_fig['data'][trace_idx]
+    if row is None:
+        del trace['x'][-1]
+        del trace['y'][-1]
+        del trace['customdata'][-1]
+    else:
+        trace['x'].append(session['horizontal'][row].item())
+        trace['y'].append(session['vertical'][row].item())
+        trace['customdata'].append([session['velo'][row].item(), session['pitch_number'][row].item()])
+    stats = pitch_stats(session)[code]
+    patched_fig['layout']['shapes'][trace_idx] = variance_shapes([code], stats)[0]
+    return patched_fig
+
+
+# Figure title, with the athlete's name when one is entered
+def figure_title(athlete_name):
+    return f"{athlete_name} Pitch Movement Visualization" if athlete_name else "Pitch Movement Visualization"
+
+
+# Build the whole figure from the data points, drawings and shaded circles
+# Memoized on data_key (see session_key), the other arguments and code_version, so an unchanged
+# state returns the cached figure without rebuilding it
+@figure_cache.memoize(make_name=lambda name: f"{name}-{code_version}", args_to_ignore=['session'])
+def build_figure(data_key, session, drawing_store, shaded_circles_store, athlete_name, reset_axes_clicks):
+    # One WebGL scatter trace per pitch type, built straight from the column buffers
+    # Plain lists rather than arrays, so the browser can append to and remove from them in place
+    groups = pitch_groups(session)
+    codes = [code for code, *_ in groups]
+    traces = []
+    for code, horizontal, vertical, customdata in groups:
+        pitch = pitch_types[code]
+        traces.append(go.Scattergl(
+            x=horizontal.tolist(),
+            y=vertical.tolist(),
+            mode='markers',
+            name=pitch,
+            uid=pitch,  # Lets plotly keep a trace's legend state when traces before it come and go
+            legendgroup=pitch,
+            marker=dict(color=code_colors[code], size=15),  # Use custom pitch colors and larger dots
+            customdata=customdata.tolist(),
+            # Values are float32, so show them to float32 precision (85.2, not 85.19999694824219)
+            hovertemplate=f"Pitch={pitch}<br>Horizontal (IN)=%{{x:.6~g}}<br>Vertical (IN)=%{{y:.6~g}}<br>"
+                          "Velo (MPH)=%{customdata[0]:.6~g}<br>Pitch#=%{customdata[1]}<extra></extra>"
+        ))
     
-    # Delete Most Recent Shaded Circle Button
-    html.Button('Delete Most Recent Shaded Circle', id='delete-most-recent-shaded-circle', n_clicks=0, style={'fontFamily': 'Roboto', 'margin': '10px'}),
+    # Dotted circles for the variance (one per trace, hidden until a pitch type has two points),
+    # then the shaded circles and drawing shapes
+    # This order lets each callback patch the shapes it owns without the rest of the list
+    stats = pitch_stats(session)[codes]
+    shapes = variance_shapes(codes, stats) + shaded_circles_store + drawing_store
     
-    # Graph
-    dcc.Graph(
-        id='movement-graph',
-        config={
-            'modeBarButtonsToAdd': ['drawopenpath'],  # Enable freehand drawing
-            'modeBarButtonsToRemove': [
-                'zoom2d', 'pan2d', 'select2d', 'lasso2d', 'zoomIn2d', 'zoomOut2d', 'autoScale2d', 'resetScale2d',
-                'hoverClosestCartesian', 'hoverCompareCartesian', 'toggleSpikelines'
-            ],  # Remove all other tools
-            'toImageButtonOptions': {
-                'format': 'png',  # Ensure the download button saves as PNG
-                'filename': 'pitch_movement_visualization',  # Default filename
-            },
-            'scrollZoom': False  # Disable zooming
-        }
-    ),
+    # The whole layout goes in when the figure is constructed, so it is validated once with no
+    # update_layout calls; the title text, shapes and axis revisions are the only parts that change between figures
+    # The axes' uirevision is the Reset Axes click count (as the reset patch sets it), so a rebuild keeps the zoom
+    layout = dict(
+        figure_layout,
+        title=dict(figure_layout['title'], text=figure_title(athlete_name)),
+        xaxis=dict(figure_layout['xaxis'], uirevision=reset_axes_clicks),
+        yaxis=dict(figure_layout['yaxis'], uirevision=reset_axes_clicks),
+        shapes=shapes
+    )
+    fig = go.Figure(data=traces, layout=layout)
     
-    # Hidden div to store the data
-    html.Div(id='data-store', style={'display': 'none'}),
+    # Cache a plain dict: unpickling a go.Figure re-runs validation and costs more than rebuilding it
+    return fig.to_dict()
+
+
+# Served per page load, after build_figure is defined (Dash validates the layout on assignment)
+app.layout = serve_layout
+
+
+# Callback to update the title as the athlete name is typed, patching only the title text
+@app.callback(
+    Output('movement-graph', 'figure', allow_duplicate=True),
+    Input('athlete-name', 'value'),  # Capture Athlete Name input
+    prevent_initial_call=True
+)
+def update_title(athlete_name):
+    patched_fig = Patch()
+    patched_fig['layout']['title']['text'] = figure_title(athlete_name)
+    return patched_fig
+
+
+# Callback to add a shaded circle with the selected draw color
+@app.callback(
+    [Output('movement-graph', 'figure', allow_duplicate=True),
+     Output('shaded-circles-store', 'data', allow_duplicate=True)],
+    Input('add-shaded-circle', 'n_clicks'),
+    [State('draw-color', 'value'),  # Get selected drawing color
+     State('circle-x', 'value'),  # Get circle center X
+     State('circle-y', 'value'),  # Get circle center Y
+     State('circle-radius', 'value'),  # Get circle radius
+     State('drawing-store', 'data')],
+    prevent_initial_call=True
+)
+def add_shaded_circle(add_shaded_circle_clicks, draw_color, circle_x, circle_y, circle_radius, drawing_store):
+    if circle_x is None or circle_y is None or circle_radius is None:
+        raise PreventUpdate  # A circle input box is blank
     
-    # Hidden div to store the drawing shapes
-    dcc.Store(id='drawing-store', data=[]),
+    new_circle = {
+        'type': 'circle',
+        'x0': circle_x - circle_radius,
+        'x1': circle_x + circle_radius,
+        'y0': circle_y - circle_radius,
+        'y1': circle_y + circle_radius,
+        'line': {'color': draw_color, 'width': 2},
+        'fillcolor': draw_color,
+        'opacity': 0.3,  # Shaded circle
+        'layer': 'below'
+    }
     
-    # Hidden div to store the shaded circles
-    dcc.Store(id='shaded-circles-store', data=[])
-])
+    # Shaded circles sit between the variance circles and the drawings, so insert the new
+    # circle just before the drawings (counting from the end, which Patch resolves in the browser)
+    patched_fig = Patch()
+    if drawing_store:
+        patched_fig['layout']['shapes'].insert(-len(drawing_store), new_circle)
+    else:
+        patched_fig['layout']['shapes'].append(new_circle)
+    patched_circles = Patch()
+    patched_circles.append(new_circle)
+    return patched_fig, patched_circles
 
 
-# Callback to update the graph and data store
-# Callback to update the graph and data store
+# Shown when a session's data points have expired from the server-side cache
+session_lost_message = (
+    "This session's data points are no longer on the server (it was idle too long), "
+    "so the graph has been cleared. Please enter the points again."
+)
+
+
+# Callback to add and delete data points
 @app.callback(
-    [Output('movement-graph', 'figure'),
-     Output('data-store', 'children'),
-     Output('drawing-store', 'data'),
-     Output('shaded-circles-store', 'data')],
+    [Output('movement-graph', 'figure', allow_duplicate=True),
+     Output('data-revision', 'data'),
+     Output('session-status', 'children')],
     [Input('add-point', 'n_clicks'),
      Input('delete-recent', 'n_clicks'),
-     Input('delete-all', 'n_clicks'),
-     Input('reset-axes', 'n_clicks'),
-     Input('movement-graph', 'relayoutData'),  # Capture drawing events
-     Input('delete-last-drawing', 'n_clicks'),  # Handle delete last drawing button
-     Input('add-shaded-circle', 'n_clicks'),  # Handle add shaded circle button
-     Input('delete-most-recent-shaded-circle', 'n_clicks'),  # Handle delete most recent shaded circle button
-     Input('athlete-name', 'value')],  # Capture Athlete Name input
+     Input('delete-all', 'n_clicks')],
     [State('horizontal-movement', 'value'),
      State('vertical-movement', 'value'),
      State('pitch-speed', 'value'),
      State('pitch-type', 'value'),  # Corrected ID: pitch-type
-     State('draw-color', 'value'),  # Get selected drawing color
-     State('circle-x', 'value'),  # Get circle center X
-     State('circle-y', 'value'),  # Get circle center Y
-     State('circle-radius', 'value'),  # Get circle radius
-     State('data-store', 'children'),
+     State('athlete-name', 'value'),
+     State('session-id', 'data'),
+     State('data-revision', 'data'),
      State('drawing-store', 'data'),
-     State('shaded-circles-store', 'data')]
+     State('shaded-circles-store', 'data'),
+     State('reset-axes', 'n_clicks')],
+    prevent_initial_call=True
 )
-def update_graph(add_clicks, delete_recent_clicks, delete_all_clicks, reset_axes_clicks, relayoutData, delete_last_drawing_clicks, add_shaded_circle_clicks, delete_most_recent_shaded_circle_clicks, athlete_name, vertical, horizontal, speed, pitch_type, draw_color, circle_x, circle_y, circle_radius, data_store, drawing_store, shaded_circles_store):
-    # Initialize an empty DataFrame if no data exists
-    if data_store is None:
-        data = pd.DataFrame(columns=['Horizontal (IN)', 'Vertical (IN)', 'Velo (MPH)', 'Pitch', 'Pitch#'])
-    else:
-        data = pd.read_json(data_store, orient='split')
-    
+def update_points(add_clicks, delete_recent_clicks, delete_all_clicks, horizontal, vertical, speed, pitch_type, athlete_name, session_id, data_revision, drawing_store, shaded_circles_store, reset_axes_clicks):
     # Determine which button was clicked
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        button_id = None
-    else:
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    
-    # Handle button actions
-    if button_id == 'add-point' and add_clicks > 0:
-        # Add new data point with Pitch# based on index + 1
-        new_data = pd.DataFrame({
-            'Horizontal (IN)': [vertical],
-            'Vertical (IN)': [horizontal],
-            'Velo (MPH)': [speed],
-            'Pitch': [pitch_type],
-            'Pitch#': [len(data) + 1]
-        })
-        data = pd.concat([data, new_data], ignore_index=True)
-    elif button_id == 'delete-recent' and delete_recent_clicks > 0 and not data.empty:
-        # Delete the most recent data point
-        data = data.iloc[:-1]  # Remove the last row
-    elif button_id == 'delete-all' and delete_all_clicks > 0:
-        # Delete all data
-        data = pd.DataFrame(columns=['Horizontal (IN)', 'Vertical (IN)', 'Velo (MPH)', 'Pitch', 'Pitch#'])
-    elif button_id == 'delete-last-drawing' and delete_last_drawing_clicks > 0 and drawing_store:
-        # Delete the last drawing
-        drawing_store = drawing_store[:-1]  # Remove the last shape
-    elif button_id == 'add-shaded-circle' and add_shaded_circle_clicks > 0:
-        # Add a shaded circle with the selected draw color
-        new_circle = {
-            'type': 'circle',
-            'x0': circle_x - circle_radius,
-            'x1': circle_x + circle_radius,
-            'y0': circle_y - circle_radius,
-            'y1': circle_y + circle_radius,
-            'line': {'color': draw_color, 'width': 2},
-            'fillcolor': draw_color,
-            'opacity': 0.3,  # Shaded circle
-            'layer': 'below'
-        }
-        shaded_circles_store.append(new_circle)
-    elif button_id == 'delete-most-recent-shaded-circle' and delete_most_recent_shaded_circle_clicks > 0 and shaded_circles_store:
-        # Delete the most recent shaded circle
-        shaded_circles_store = shaded_circles_store[:-1]  # Remove the last shaded circle
-    
-    # Calculate variance and mean for each pitch type
-    variance_data = []
-    for pitch in data['Pitch'].unique():
-        pitch_data = data[data['Pitch'] == pitch]
-        horizontal_var = pitch_data['Horizontal (IN)'].var()
-        vertical_var = pitch_data['Vertical (IN)'].var()
-        variance_data.append({
-            'Pitch': pitch,
-            'Horizontal Variance': horizontal_var,
-            'Vertical Variance': vertical_var,
-            'Vertical Mean': pitch_data['Vertical (IN)'].mean(),
-            'Horizontal Mean': pitch_data['Horizontal (IN)'].mean()
-        })
-    
-    # Create the figure
-    fig = px.scatter(data, x='Horizontal (IN)', y='Vertical (IN)', 
-                     color='Pitch', hover_data=['Velo (MPH)', 'Pitch', 'Pitch#'],
-                     title=f"{athlete_name} Pitch Movement Visualization" if athlete_name else "Pitch Movement Visualization",
-                     size_max=20,  # Increase dot size
-                     color_discrete_map=pitch_colors)  # Use custom pitch colors
-    
-    # Update layout for a cool font and larger dots
-    fig.update_traces(marker=dict(size=15))  # Set data points size to 15
-    fig.update_layout(
-        font_family="Roboto",
-        title_font_size=24,
-        title_font_color="darkblue",
-        xaxis_title="Horizontal (IN)",
-        yaxis_title="Vertical (IN)",
-        xaxis=dict(
-            title_font=dict(size=18, family="Roboto"),
-            range=[-20, 20],  # Fixed x-axis range
-            scaleanchor="y",  # Ensure x and y axes are scaled equally
-            scaleratio=1,  # Maintain a 1:1 aspect ratio
-            showgrid=True,
-            gridcolor="lightgray",  # Light gray gridlines
-            gridwidth=1,  # Thin gridlines
-            zeroline=True,  # Show the x=0 line
-            zerolinewidth=2,  # Bold x=0 line
-            zerolinecolor='black'  # Color of the x=0 line
-        ),
-        yaxis=dict(
-            title_font=dict(size=18, family="Roboto"),
-            range=[-20, 20],  # Fixed y-axis range
-            showgrid=True,
-            gridcolor="lightgray",  # Light gray gridlines
-            gridwidth=1,  # Thin gridlines
-            zeroline=True,  # Show the y=0 line
-            zerolinewidth=2,  # Bold y=0 line
-            zerolinecolor='black'  # Color of the y=0 line
-        ),
-        plot_bgcolor='white',  # Set background color to white
-        width=800,  # Set a fixed width for the graph
-        height=800  # Set a fixed height for the graph (to make it square)
-    )
-    
-    # Add dotted circles for the variance
-    for var in variance_data:
-        if not np.isnan(var['Horizontal Variance']) and not np.isnan(var['Vertical Variance']):
-            # Get the color for the pitch type
-            color = pitch_colors[var['Pitch']]
-            
-            # Add dotted circle for the variance
-            fig.add_shape(
-                type="circle",
-                x0=var['Horizontal Mean'] - np.sqrt(var['Horizontal Variance']),
-                x1=var['Horizontal Mean'] + np.sqrt(var['Horizontal Variance']),
-                y0=var['Vertical Mean'] - np.sqrt(var['Vertical Variance']),
-                y1=var['Vertical Mean'] + np.sqrt(var['Vertical Variance']),
-                line=dict(color=color, width=2, dash='dot'),  # Dotted line for variance
-                layer="below"
-            )
-    
-    # Handle drawing events
-    if relayoutData and 'shapes' in relayoutData:
-        # Get the new shape from the drawing event
-        new_shape = relayoutData['shapes'][-1]
-        # Set the color of the new shape to the selected draw_color
-        new_shape['line'] = {'color': draw_color, 'width': 2}
-        # Add the new shape to the drawing store
-        drawing_store.append(new_shape)
+    button_id = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
     
-    # Add all drawing shapes to the figure
-    for shape in drawing_store:
-        fig.add_shape(shape)
+    # Load, change and save the session under its lock, so a concurrent callback can't lose this change
+    # Only the new state is worked out under the lock; the figure is built after it is released
+    patched_fig = None
+    status = ''
+    with session_lock(session_id):
+        # Load this session's data points from the server-side cache
+        session = load_session(session_id)
+        n = session['n_rows']
+        
+        # A Patch is a change to the figure on the page, so it is only sent when that figure shows the
+        # session's current revision; a page that missed a response (Dash drops the result of a callback
+        # that is triggered again while it runs) gets the whole figure instead
+        in_sync = data_revision == session['revision']
+        
+        # Points per pitch type before this callback, used to patch an existing trace in place
+        counts = pitch_counts(session)
+        
+        # Handle button actions
+        changed = True
+        if data_revision and not session['revision']:
+            # The page has points but the server has no session for it (expired or evicted), so show
+            # the empty figure the server has and say so, rather than changing it as if nothing happened
+            changed = False
+            status = session_lost_message
+        elif button_id == 'add-point' and add_clicks > 0:
+            # Add new data point with the next Pitch#, so numbers stay stable after deletes
+            code = pitch_codes[pitch_type]
+            session['next_id'] += 1
+            values = {
+                'pitch_code': code,
+                'horizontal': horizontal,
+                'vertical': vertical,
+                'velo': speed,
+                'pitch_number': session['next_id']
+            }
+            for column in data_columns:
+                session[column] = buffer_append(session[column], n, values[column])
+            session['n_rows'] = n + 1
+            if counts[code] and in_sync:
+                # The pitch type already has a trace, so only that trace changes
+                patched_fig = patch_pitch(session, code, trace_index(counts, code), n)
+        elif button_id == 'delete-recent' and delete_recent_clicks > 0 and n:
+            # Delete the most recent data point; saving the session drops its buffer slots
+            code = session['pitch_code'][n - 1]
+            session['n_rows'] = n - 1  # Remove the last row
+            if counts[code] > 1 and in_sync:
+                # The pitch type still has points, so only that trace changes
+                patched_fig = patch_pitch(session, code, trace_index(counts, code))
+        elif button_id == 'delete-all' and delete_all_clicks > 0 and session['next_id']:
+            # Delete all data and start numbering pitches from 1 again
+            session['n_rows'] = 0
+            session['next_id'] = 0
+        elif in_sync:
+            # Nothing to delete, so skip saving the session and rebuilding the figure
+            raise PreventUpdate
+        else:
+            # Nothing to change, but the figure on the page is out of date, so send the whole figure
+            changed = False
+        
+        if changed:
+            # Keep the data points in the server-side cache for the next callback
+            session['revision'] += 1
+            save_session(session_id, session)
     
-    # Add all shaded circles to the figure
-    for circle in shaded_circles_store:
-        fig.add_shape(circle)
+    if patched_fig is not None:
+        return patched_fig, session['revision'], status
+    return build_figure(session_key(session), session, drawing_store, shaded_circles_store, athlete_name, reset_axes_clicks), session['revision'], status
+
+
+# Callback to add a freehand drawing to the graph
+@app.callback(
+    [Output('movement-graph', 'figure', allow_duplicate=True),
+     Output('drawing-store', 'data', allow_duplicate=True)],
+    Input('movement-graph', 'relayoutData'),  # Capture drawing events
+    State('draw-color', 'value'),  # Get selected drawing color
+    prevent_initial_call=True
+)
+def add_drawing(relayoutData, draw_color):
+    # Pan, zoom, autosize and dragmode events leave the figure and drawing store untouched
+    if not relayoutData or 'shapes' not in relayoutData:
+        raise PreventUpdate
     
-    # Update the data store and drawing store
-    data_json = data.to_json(orient='split')
+    # Get the new shape from the drawing event
+    new_shape = relayoutData['shapes'][-1]
+    # Set the color of the new shape to the selected draw_color
+    new_shape['line'] = {'color': draw_color, 'width': 2}
     
-    return fig, data_json, drawing_store, shaded_circles_store
+    # Append only the new shape to the figure (drawings are the last shapes) and to the
+    # drawing store, so neither is sent whole
+    patched_fig = Patch()
+    patched_fig['layout']['shapes'].append(new_shape)
+    patched_drawings = Patch()
+    patched_drawings.append(new_shape)
+    return patched_fig, patched_drawings
+
+
+# Callback to delete the last drawing, run in the browser since it needs no server state
+# Drawings are the last shapes in the figure
+app.clientside_callback(
+    """
+    function(delete_last_drawing_clicks, drawing_store) {
+        if (!drawing_store || !drawing_store.length) {
+            throw window.dash_clientside.PreventUpdate;  // No drawings to delete
+        }
+        const patched_fig = new window.dash_clientside.Patch();
+        patched_fig.delete(['layout', 'shapes', -1]);
+        return [patched_fig.build(), drawing_store.slice(0, -1)];
+    }
+    """,
+    [Output('movement-graph', 'figure', allow_duplicate=True),
+     Output('drawing-store', 'data', allow_duplicate=True)],
+    Input('delete-last-drawing', 'n_clicks'),
+    State('drawing-store', 'data'),
+    prevent_initial_call=True
+)
+
+
+# Callback to delete the most recent shaded circle, run in the browser
+# The most recent shaded circle is the shape just before the drawings
+app.clientside_callback(
+    """
+    function(delete_most_recent_shaded_circle_clicks, drawing_store, shaded_circles_store) {
+        if (!shaded_circles_store || !shaded_circles_store.length) {
+            throw window.dash_clientside.PreventUpdate;  // No shaded circles to delete
+        }
+        const patched_fig = new window.dash_clientside.Patch();
+        patched_fig.delete(['layout', 'shapes', -drawing_store.length - 1]);
+        return [patched_fig.build(), shaded_circles_store.slice(0, -1)];
+    }
+    """,
+    [Output('movement-graph', 'figure', allow_duplicate=True),
+     Output('shaded-circles-store', 'data', allow_duplicate=True)],
+    Input('delete-most-recent-shaded-circle', 'n_clicks'),
+    [State('drawing-store', 'data'),
+     State('shaded-circles-store', 'data')],
+    prevent_initial_call=True
+)
+
+
+# Callback to reset the axes to their fixed range, run in the browser
+# With a constant uirevision plotly keeps the user's zoom over an unchanged layout range, so the
+# axes also get a new uirevision (the click count, which build_figure also uses) to make them take the fixed range again
+app.clientside_callback(
+    f"""
+    function(reset_axes_clicks) {{
+        const patched_fig = new window.dash_clientside.Patch();
+        patched_fig.assign(['layout', 'xaxis', 'uirevision'], reset_axes_clicks);
+        patched_fig.assign(['layout', 'yaxis', 'uirevision'], reset_axes_clicks);
+        patched_fig.assign(['layout', 'xaxis', 'range'], {figure_layout['xaxis']['range']});
+        patched_fig.assign(['layout', 'yaxis', 'range'], {figure_layout['yaxis']['range']});
+        return patched_fig.build();
+    }}
+    """,
+    Output('movement-graph', 'figure', allow_duplicate=True),
+    Input('reset-axes', 'n_clicks'),
+    prevent_initial_call=True
+)
 
 
 server = app.server
 
-# Run the app
+# Run the app with the development server (set DASH_DEV for debug mode and hot reloading)
+# In production the app is served by gunicorn, configured in gunicorn.conf.py
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    app.run(debug=bool(os.getenv('DASH_DEV')))
@@ -0,0 +1,9 @@
+import os
+
+# Gunicorn settings, picked up automatically by `gunicorn CBC:server` (see Procfile)
+# WEB_CONCURRENCY worker processes (set by Heroku-style hosts to what the dyno's memory allows),
+# or one per CPU, each with a few threads so independent callbacks (drawing, zooming, adding points)
+# don't wait on each other
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 2))
+threads = 4
+worker_class = 'gthread'